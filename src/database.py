@@ -1,5 +1,8 @@
 import sqlite3
 import os
+import json
+import time
+import zlib
 from datetime import datetime
 import pathlib
 
@@ -10,72 +13,319 @@ DB_PATH = DB_DIR / "newser.db"
 # Upewniamy się, że katalog istnieje
 DB_DIR.mkdir(exist_ok=True)
 
+# Wersja schematu zapisywana w PRAGMA user_version
+SCHEMA_VERSION = 1
 
-def init_db():
-    """Inicjalizuje bazę danych i tworzy tabele, jeśli nie istnieją."""
+# Pola artykułu zapisywane w sesji - reszta odpowiedzi API nie jest potrzebna
+SESSION_ARTICLE_FIELDS = ("article_id", "title", "link", "description", "pubDate")
+
+
+def _connect():
+    """Otwiera połączenie z bazą danych z włączonymi kluczami obcymi."""
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
 
-    # Tworzenie tabeli ulubionych
+def _create_tables(cursor):
+    # Wspólna tabela artykułów - każdy artykuł zapisany jest tylko raz
     cursor.execute(
         """
-    CREATE TABLE IF NOT EXISTS favorites (
+    CREATE TABLE IF NOT EXISTS articles (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT NOT NULL,
+        article_id TEXT UNIQUE,
+        link TEXT NOT NULL UNIQUE,
         title TEXT NOT NULL,
-        link TEXT NOT NULL,
+        description TEXT,
+        pub_date TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """
     )
 
-    conn.commit()
-    conn.close()
+    # Tabela ulubionych łącząca użytkowników z artykułami
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS favorites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        article_ref INTEGER NOT NULL REFERENCES articles(id),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, article_ref)
+    )
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_favorites_article ON favorites (article_ref)"
+    )
+
+    # Ostatnio wyświetlone wyniki użytkownika (skompresowany JSON) z czasem wygaśnięcia
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id TEXT PRIMARY KEY,
+        articles BLOB NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+    """
+    )
+
+
+def _copy_legacy_favorites(cursor):
+    """Przenosi dane ze starej tabeli favorites (title, link w każdym wierszu) do nowego schematu."""
+    # Jeden wiersz w articles na każdy link - tytuł z najnowszego wpisu
+    cursor.execute(
+        """
+    INSERT OR IGNORE INTO articles (link, title, created_at)
+    SELECT link, title, created_at FROM favorites_legacy ORDER BY id DESC
+    """
+    )
+    # Zachowujemy ID i daty ulubionych; powtórzenia u jednego użytkownika są pomijane
+    cursor.execute(
+        """
+    INSERT OR IGNORE INTO favorites (id, user_id, article_ref, created_at)
+    SELECT f.id, f.user_id, a.id, f.created_at
+    FROM favorites_legacy f JOIN articles a ON a.link = f.link
+    ORDER BY f.id
+    """
+    )
+    cursor.execute("DROP TABLE favorites_legacy")
+
+
+def init_db():
+    """Inicjalizuje bazę danych, tworzy tabele i migruje stary schemat."""
+    conn = _connect()
+    # Transakcją sterujemy ręcznie, aby migracja (łącznie z DDL) była atomowa
+    conn.isolation_level = None
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        tables = {
+            row[0]
+            for row in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall()
+        }
+        if version < 1:
+            columns = [
+                row[1]
+                for row in cursor.execute("PRAGMA table_info(favorites)").fetchall()
+            ]
+            if "title" in columns:
+                cursor.execute("ALTER TABLE favorites RENAME TO favorites_legacy")
+                tables.add("favorites_legacy")
+
+        _create_tables(cursor)
+        # Pozostałość po przerwanej migracji z wcześniejszych wersji jest dokańczana
+        if "favorites_legacy" in tables:
+            _copy_legacy_favorites(cursor)
 
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cursor.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        cursor.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
-def add_favorite_db(user_id, title, link):
+
+def add_favorite_db(
+    user_id, title, link, article_id=None, description=None, pub_date=None
+):
     """Dodaje ulubiony artykuł do bazy danych."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
+    cursor = conn.cursor()
+
+    try:
+        # Szukamy artykułu zapisanego już przez innego użytkownika
+        cursor.execute(
+            "SELECT id FROM articles WHERE link = ? OR (article_id IS NOT NULL AND article_id = ?)",
+            (link, article_id),
+        )
+        row = cursor.fetchone()
+        if row:
+            article_ref = row[0]
+            # Artykuły przeniesione ze starej tabeli nie mają article_id - uzupełniamy je,
+            # o ile inny wiersz nie używa już tego identyfikatora
+            cursor.execute(
+                """
+            UPDATE articles SET
+                title = ?,
+                description = COALESCE(?, description),
+                pub_date = COALESCE(?, pub_date),
+                article_id = COALESCE(
+                    article_id,
+                    (SELECT ? WHERE NOT EXISTS (SELECT 1 FROM articles WHERE article_id = ?))
+                )
+            WHERE id = ?
+            """,
+                (title, description, pub_date, article_id, article_id, article_ref),
+            )
+        else:
+            cursor.execute(
+                "INSERT INTO articles (article_id, link, title, description, pub_date) VALUES (?, ?, ?, ?, ?)",
+                (article_id, link, title, description, pub_date),
+            )
+            article_ref = cursor.lastrowid
+
+        # Ponowne dodanie tego samego artykułu przez użytkownika nic nie zmienia
+        cursor.execute(
+            "INSERT INTO favorites (user_id, article_ref) VALUES (?, ?) ON CONFLICT (user_id, article_ref) DO NOTHING",
+            (user_id, article_ref),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def iter_favorites_db(user_id, batch_size=500):
+    """Zwraca generator ulubionych artykułów użytkownika pobieranych z kursora partiami."""
+    conn = _connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+        SELECT f.id, a.title, a.link, a.description, a.pub_date, f.created_at
+        FROM favorites f JOIN articles a ON a.id = f.article_ref
+        WHERE f.user_id = ?
+        ORDER BY f.created_at DESC, f.id
+        """,
+            (user_id,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "title": row[1],
+                    "link": row[2],
+                    "description": row[3],
+                    "pub_date": row[4],
+                    "created_at": row[5],
+                }
+    finally:
+        conn.close()
+
+
+def get_favorites_db(user_id):
+    """Pobiera wszystkie ulubione artykuły użytkownika."""
+    return list(iter_favorites_db(user_id))
+
+
+def remove_favorite_db(user_id, favorite_id):
+    """Usuwa ulubiony artykuł z bazy danych."""
+    conn = _connect()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "SELECT article_ref FROM favorites WHERE id = ? AND user_id = ?",
+            (favorite_id, user_id),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return False
+
+        cursor.execute(
+            "DELETE FROM favorites WHERE id = ? AND user_id = ?", (favorite_id, user_id)
+        )
+        # Artykuł, którego nikt już nie ma w ulubionych, nie jest dłużej przechowywany
+        cursor.execute(
+            "DELETE FROM articles WHERE id = ? AND NOT EXISTS (SELECT 1 FROM favorites WHERE article_ref = ?)",
+            (row[0], row[0]),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    return True  # Zwraca True, jeśli coś zostało usunięte
+
+
+def get_article_popularity_db(link):
+    """Zwraca liczbę użytkowników, którzy dodali artykuł do ulubionych."""
+    conn = _connect()
     cursor = conn.cursor()
 
     cursor.execute(
-        "INSERT INTO favorites (user_id, title, link) VALUES (?, ?, ?)",
-        (user_id, title, link),
+        """
+    SELECT COUNT(f.id)
+    FROM articles a LEFT JOIN favorites f ON f.article_ref = a.id
+    WHERE a.link = ?
+    """,
+        (link,),
     )
+    count = cursor.fetchone()[0]
 
-    conn.commit()
     conn.close()
+    return count
 
 
-def get_favorites_db(user_id):
-    """Pobiera wszystkie ulubione artykuły użytkownika."""
-    conn = sqlite3.connect(DB_PATH)
+def get_popular_articles_db(limit=10):
+    """Pobiera artykuły najczęściej dodawane do ulubionych."""
+    conn = _connect()
     cursor = conn.cursor()
 
     cursor.execute(
-        "SELECT id, title, link FROM favorites WHERE user_id = ? ORDER BY created_at DESC",
-        (user_id,),
+        """
+    SELECT a.title, a.link, COUNT(*) AS favorites_count
+    FROM favorites f JOIN articles a ON a.id = f.article_ref
+    GROUP BY a.id
+    ORDER BY favorites_count DESC, a.id
+    LIMIT ?
+    """,
+        (limit,),
     )
     results = cursor.fetchall()
 
     conn.close()
 
-    # Konwertuj wyniki na listę słowników
-    favorites = [{"id": row[0], "title": row[1], "link": row[2]} for row in results]
-    return favorites
+    return [
+        {"title": row[0], "link": row[1], "favorites_count": row[2]} for row in results
+    ]
 
 
-def remove_favorite_db(user_id, favorite_id):
-    """Usuwa ulubiony artykuł z bazy danych."""
-    conn = sqlite3.connect(DB_PATH)
+def save_session_db(user_id, articles, ttl):
+    """Zapisuje ostatnio wyświetlone artykuły użytkownika na `ttl` sekund."""
+    compact = [
+        {field: article[field] for field in SESSION_ARTICLE_FIELDS if article.get(field)}
+        for article in articles
+    ]
+    payload = zlib.compress(
+        json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+
+    conn = _connect()
     cursor = conn.cursor()
 
     cursor.execute(
-        "DELETE FROM favorites WHERE id = ? AND user_id = ?", (favorite_id, user_id)
+        "INSERT OR REPLACE INTO sessions (user_id, articles, expires_at) VALUES (?, ?, ?)",
+        (user_id, payload, time.time() + ttl),
     )
-    affected_rows = cursor.rowcount
 
     conn.commit()
     conn.close()
 
-    return affected_rows > 0  # Zwraca True, jeśli coś zostało usunięte
+
+def load_session_db(user_id):
+    """Pobiera (artykuły, czas wygaśnięcia) sesji lub None, jeśli sesja nie istnieje lub wygasła."""
+    conn = _connect()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT articles, expires_at FROM sessions WHERE user_id = ? AND expires_at > ?",
+        (user_id, time.time()),
+    )
+    row = cursor.fetchone()
+
+    conn.close()
+
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(row[0]).decode("utf-8")), row[1]
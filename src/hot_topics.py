@@ -0,0 +1,99 @@
+import hashlib
+import heapq
+import re
+import time
+
+
+def normalize_topic(topic):
+    """Sprowadza temat do postaci kanonicznej: małe litery, pojedyncze spacje, bez interpunkcji na brzegach."""
+    topic = re.sub(r"\s+", " ", topic.lower()).strip()
+    return topic.strip(".,;:!?\"'")
+
+
+class CountMinSketch:
+    """Szkic count-min: przybliżone liczniki w stałej pamięci (width x depth).
+
+    Oszacowanie nigdy nie jest mniejsze od prawdziwej liczby wystąpień.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8 * self.depth)
+        data = digest.digest()
+        for row in range(self.depth):
+            chunk = data[row * 8 : (row + 1) * 8]
+            yield row, int.from_bytes(chunk, "little") % self.width
+
+    def add(self, key, count=1):
+        """Zwiększa licznik klucza i zwraca jego nowe oszacowanie."""
+        estimate = None
+        for row, index in self._indexes(key):
+            self.rows[row][index] += count
+            value = self.rows[row][index]
+            estimate = value if estimate is None else min(estimate, value)
+        return estimate
+
+    def estimate(self, key):
+        return min(self.rows[row][index] for row, index in self._indexes(key))
+
+
+class HotTopics:
+    """Śledzi najczęściej wyszukiwane tematy: szkic count-min plus kopiec top-K."""
+
+    def __init__(self, k=10, width=2048, depth=4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.counts = {}  # temat -> oszacowanie, tylko dla tematów z top-K
+        self.last_seen = {}  # temat -> czas ostatniego wyszukania, tylko dla top-K
+        self.heap = []  # (oszacowanie, temat), najmniejszy na szczycie
+
+    def add(self, topic, language):
+        """Rejestruje wyszukanie tematu w danym języku."""
+        key = f"{normalize_topic(topic)}|{language}"
+        estimate = self.sketch.add(key)
+
+        if key in self.counts:
+            self.counts[key] = estimate
+            self.heap = [(self.counts[item], item) for _, item in self.heap]
+            heapq.heapify(self.heap)
+        elif len(self.heap) < self.k:
+            self.counts[key] = estimate
+            heapq.heappush(self.heap, (estimate, key))
+        elif estimate > self.heap[0][0]:
+            _, removed = heapq.heapreplace(self.heap, (estimate, key))
+            del self.counts[removed]
+            del self.last_seen[removed]
+            self.counts[key] = estimate
+        else:
+            return
+        self.last_seen[key] = time.monotonic()
+
+    def top(self, n=None, min_count=1, max_age=None):
+        """Zwraca listę (temat, język, oszacowanie) od najczęściej wyszukiwanych.
+
+        `min_count` pomija rzadkie tematy, a `max_age` (s) tematy, których nikt
+        ostatnio nie wyszukiwał.
+        """
+        now = time.monotonic()
+        ranked = [
+            (count, key)
+            for count, key in sorted(self.heap, key=lambda item: (-item[0], item[1]))
+            if count >= min_count
+            and (max_age is None or now - self.last_seen[key] <= max_age)
+        ][:n]
+        return [(*key.rsplit("|", 1), count) for count, key in ranked]
+
+    def summary(self, n=10):
+        """Krótki opis najpopularniejszych tematów do wyświetlenia administratorowi."""
+        top = self.top(n)
+        if not top:
+            return "Najpopularniejsze tematy: brak danych."
+        lines = [
+            f"{i}. {topic} [{language}] - ~{count}"
+            for i, (topic, language, count) in enumerate(top, 1)
+        ]
+        return "Najpopularniejsze tematy:\n" + "\n".join(lines)
@@ -1,13 +1,37 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
 import os
 import sys
+import tempfile
+import time
+from typing import Literal
+from collections import OrderedDict
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import discord
-from discord.ext import commands
+from discord import app_commands
+from discord.ext import commands, tasks
 import requests
 from dotenv import load_dotenv
 import google.generativeai as genai
-from src.database import add_favorite_db, get_favorites_db, remove_favorite_db, init_db
+from google.api_core import exceptions as google_exceptions
+from src.database import (
+    DB_DIR,
+    add_favorite_db,
+    get_favorites_db,
+    iter_favorites_db,
+    load_session_db,
+    remove_favorite_db,
+    save_session_db,
+    init_db,
+)
+from src.recorder import UpstreamRecorder
+from src.resilience import CircuitOpenError, ResilientUpstream
+from src.hot_topics import HotTopics, normalize_topic
+from src.speculation import SpeculativeEditor
 
 init_db()
 
@@ -21,72 +45,272 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
 model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")
 
+# Maksymalna liczba równoległych zapytań do NewsData przy wielu tematach/językach
+NEWSDATA_MAX_CONCURRENCY = int(os.getenv("NEWSDATA_MAX_CONCURRENCY", "4"))
+# Limity jednego polecenia: liczba tematów, języków i wszystkich par temat/język
+NEWSDATA_MAX_TOPICS = int(os.getenv("NEWSDATA_MAX_TOPICS", "5"))
+NEWSDATA_MAX_LANGUAGES = int(os.getenv("NEWSDATA_MAX_LANGUAGES", "3"))
+NEWSDATA_MAX_REQUESTS = int(os.getenv("NEWSDATA_MAX_REQUESTS", "6"))
+DEFAULT_LANGUAGE = "pl"
+NEWSDATA_URL = "https://newsdata.io/api/1/news"
+NEWSDATA_TIMEOUT = float(os.getenv("NEWSDATA_TIMEOUT", "10"))
+
+# Czas (s), przez jaki ostatnie wyniki użytkownika są pamiętane w bazie
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+
+# Wstępna redakcja AI pierwszych N wyświetlonych artykułów (0 = wyłączona) i jej godzinowy limit
+SPECULATIVE_EDIT_TOP_N = int(os.getenv("SPECULATIVE_EDIT_TOP_N", "0"))
+SPECULATIVE_EDIT_BUDGET = int(os.getenv("SPECULATIVE_EDIT_BUDGET", "30"))
+
+# Nagrywanie (record) i odtwarzanie (replay) odpowiedzi NewsData i Gemini bez dostępu do sieci
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "off")
+UPSTREAM_RECORDINGS = os.getenv(
+    "UPSTREAM_RECORDINGS", str(DB_DIR / "upstream-recordings")
+)
+UPSTREAM_REPLAY_LATENCY_SCALE = float(os.getenv("UPSTREAM_REPLAY_LATENCY_SCALE", "1"))
+
+# Odporność na awarie zewnętrznych API (ponawianie, hedging, bezpiecznik)
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_HEDGING = os.getenv("UPSTREAM_HEDGING", "0") == "1"
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Stały komunikat o błędzie NewsData - treść wyjątku requests zawiera URL z kluczem API
+NEWSDATA_ERROR_MESSAGE = (
+    "Błąd podczas pobierania danych z serwisu NewsData. Spróbuj ponownie później."
+)
+# Stały komunikat o błędzie Gemini - treść wyjątku zawiera szczegóły projektu Google
+GEMINI_ERROR_MESSAGE = "Błąd podczas redagowania przez AI. Spróbuj ponownie później."
+
+# Maksymalna liczba zapamiętanych wyników NewsData serwowanych przy awarii usługi
+NEWS_ARCHIVE_SIZE = 500
+# Czas (s), przez jaki zapamiętane wyniki NewsData są serwowane bez nowego zapytania (0 = wyłączone)
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", "300"))
+
+# Odświeżanie wyników dla najpopularniejszych tematów przed wygaśnięciem ich wpisów
+# (0 = wyłączone). Odświeżane są tylko tematy wyszukane co najmniej MIN_COUNT razy
+# i ostatnio w ciągu NEWS_CACHE_TTL, więc bez ruchu bot nie wysyła zapytań do API.
+HOT_TOPICS_WARM_K = int(os.getenv("HOT_TOPICS_WARM_K", "0"))
+HOT_TOPICS_WARM_MIN_COUNT = int(os.getenv("HOT_TOPICS_WARM_MIN_COUNT", "3"))
+HOT_TOPICS_WARM_INTERVAL = float(os.getenv("HOT_TOPICS_WARM_INTERVAL", "60"))
+
+# Eksport ulubionych: do tego rozmiaru bufor trzymany jest w pamięci, potem w pliku tymczasowym
+EXPORT_SPOOL_SIZE = 1024 * 1024
+# Limit rozmiaru załącznika na Discordzie
+EXPORT_MAX_UPLOAD_SIZE = 8 * 1024 * 1024
+EXPORT_FIELDS = ["title", "link", "description", "pub_date", "created_at"]
+
+
+def is_transient_newsdata_error(error):
+    """Błędy sieciowe, przekroczenia czasu oraz odpowiedzi 429/5xx są chwilowe"""
+    if isinstance(error, requests.HTTPError):
+        status = getattr(error.response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def is_transient_gemini_error(error):
+    return isinstance(
+        error,
+        (
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        ),
+    )
+
+
+upstream_recorder = UpstreamRecorder(
+    UPSTREAM_MODE,
+    UPSTREAM_RECORDINGS,
+    latency_scale=UPSTREAM_REPLAY_LATENCY_SCALE,
+    secrets=[NEWSDATA_API_KEY, GOOGLE_API_KEY],
+)
+
+newsdata_upstream = ResilientUpstream(
+    "NewsData",
+    is_transient_newsdata_error,
+    retries=UPSTREAM_RETRIES,
+    hedge=UPSTREAM_HEDGING,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+)
+# Zapytania do Gemini nie są dublowane, żeby nie zużywać limitu
+gemini_upstream = ResilientUpstream(
+    "Gemini",
+    is_transient_gemini_error,
+    retries=UPSTREAM_RETRIES,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+)
+# Wstępna redakcja w tle nie ponawia zapytań (limit liczony jest za każde zapytanie)
+# i ma własny bezpiecznik, aby jej błędy nie blokowały redakcji na żądanie
+speculative_gemini_upstream = ResilientUpstream(
+    "Gemini",
+    is_transient_gemini_error,
+    retries=0,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+)
+
+# Bez intencji wiadomości na serwerach bot ich nie odbiera - działają tylko komendy /news
+# i komendy !news w wiadomościach prywatnych
+DISABLE_MESSAGE_CONTENT = os.getenv("DISABLE_MESSAGE_CONTENT", "0") == "1"
+# Synchronizacja komend /news z Discordem przy starcie bota
+SYNC_SLASH_COMMANDS = os.getenv("SYNC_SLASH_COMMANDS", "1") == "1"
+
 # Intencje i prefiks
 intents = discord.Intents.default()
-intents.message_content = True
+intents.message_content = not DISABLE_MESSAGE_CONTENT
+# Sama intencja treści nie zmniejsza ruchu - Discord nadal wysyłałby każdą wiadomość z serwera
+intents.guild_messages = not DISABLE_MESSAGE_CONTENT
 bot = commands.Bot(command_prefix="!", intents=intents, heartbeat_timeout=60.0)
 
-# Pamięć ostatnich wiadomości na użytkownika
+# Pamięć ostatnich wiadomości na użytkownika (kopia sesji zapisanych w bazie)
 last_articles = {}
+# Czas wygaśnięcia sesji w pamięci (ten sam co w bazie)
+session_expiry = {}
 
 # Słownik mapujący numery wyświetlane użytkownikowi na rzeczywiste ID z bazy danych
 favorite_id_mapping = {}
 
+# Ostatnie poprawne wyniki NewsData (temat, język) -> (czas pobrania, artykuły);
+# świeże wpisy służą jako pamięć podręczna, starsze tylko gdy usługa nie działa
+news_archive = OrderedDict()
+
+# Przybliżone liczniki wyszukiwanych tematów w stałej pamięci
+hot_topics = HotTopics(k=max(10, HOT_TOPICS_WARM_K))
+
 
 @bot.event
 async def on_ready():
     print("Zalogowano jako Newser")
 
 
+def remember_articles(user_id, articles):
+    """Zapamiętuje wyświetlone artykuły w pamięci i w bazie, aby przetrwały restart bota"""
+    last_articles[user_id] = articles
+    session_expiry[user_id] = time.time() + SESSION_TTL
+    save_session_db(user_id, articles, SESSION_TTL)
+
+
+def get_last_articles(user_id):
+    """Zwraca ostatnio wyświetlone artykuły, wczytując sesję z bazy przy pierwszym odwołaniu"""
+    if session_expiry.get(user_id, float("inf")) <= time.time():
+        # Sesja wygasła także w pamięci - nie podajemy starych wyników
+        last_articles.pop(user_id, None)
+        session_expiry.pop(user_id, None)
+    if user_id not in last_articles:
+        session = load_session_db(user_id)
+        if session is None:
+            return []
+        last_articles[user_id], session_expiry[user_id] = session
+    return last_articles[user_id]
+
+
 async def handle_help(ctx):
     await ctx.send(
         """
 **Pomoc - Komendy !news:**
 `!news <temat>` - Wyszukaj najnowsze wiadomości na dany temat (domyślnie 3 artykuły).
 `!news <temat> [liczba]` - Wyszukaj określoną liczbę wiadomości (1-10) na dany temat.
+`!news <temat>; <temat>; ...` - Wyszukaj wiadomości z kilku tematów naraz (wyniki posortowane od najnowszych).
+`!news <temat> jezyk:pl,en` - Wyszukaj wiadomości w wybranych językach (domyślnie pl).
 `!news redaguj <temat>` - Pobierz wiadomości i zredaguj ich treść za pomocą AI.
 `!news redaguj <numer>` - Zredaguj wiadomość z ostatnio wyświetlonych wyników.
 `!news ulubione` - Zobacz swoje zapisane ulubione wiadomości.
+`!news eksport [json|csv]` - Pobierz swoje ulubione wiadomości jako skompresowany plik.
 `!news dodaj <numer>` - Dodaj wskazaną wiadomość z listy do ulubionych.
 `!news usun <numer>` - Usuń wskazaną wiadomość z listy ulubionych.
+Wszystkie komendy są dostępne także jako `/news` (np. `/news szukaj`).
 """
     )
 
 
-async def edit_article(ctx, article):
-    """Helper function to edit a single article using AI"""
+def generate_text(prompt):
+    """Wywołuje Gemini i zwraca tekst odpowiedzi (nagrywany lub odtwarzany w trybie UPSTREAM_MODE)"""
+    return upstream_recorder.call(
+        "gemini", prompt, lambda: model.generate_content(prompt).text
+    )
+
+
+async def generate_edit(article, upstream=None):
+    """Generuje zredagowaną treść artykułu za pomocą Gemini"""
     title = article.get("title", "")
     description = article.get("description", "")
-    link = article.get("link", "")
     prompt = f"Zredaguj tę wiadomość w bardziej przystępny i naturalny jeden sposób:\nTytuł: {title}\nOpis: {description} \n Opisz to w max 3 zdaniach, nie wypisuj tytułu. Pisz profesjonalnie."
+    return await (upstream or gemini_upstream).call(generate_text, prompt)
+
+
+async def generate_speculative_edit(article):
+    """Redakcja w tle: jedno zapytanie bez ponowień i z osobnym bezpiecznikiem"""
+    return await generate_edit(article, upstream=speculative_gemini_upstream)
+
+
+speculative_editor = SpeculativeEditor(
+    generate_speculative_edit,
+    top_n=SPECULATIVE_EDIT_TOP_N,
+    budget_per_hour=SPECULATIVE_EDIT_BUDGET,
+)
+
+
+async def edit_article(ctx, article, rank=None):
+    """Helper function to edit a single article using AI"""
+    link = article.get("link", "")
     try:
-        response = model.generate_content(prompt)
-        await ctx.send(f"🎨 **Zredagowana wersja:**\n{response.text}\n🔗 {link}")
+        # Najpierw sprawdzamy, czy redakcja nie została przygotowana (lub nie trwa) w tle
+        text = await speculative_editor.take_or_wait(link, rank)
+        if text is None:
+            async with speculative_editor.interactive():
+                text = await generate_edit(article)
+        await ctx.send(f"🎨 **Zredagowana wersja:**\n{text}\n🔗 {link}")
+    except CircuitOpenError:
+        await ctx.send(
+            "Redakcja AI jest chwilowo niedostępna. Spróbuj ponownie za chwilę."
+        )
+    except google_exceptions.GoogleAPIError as e:
+        print(f"Błąd Gemini podczas redagowania: {e}")
+        await ctx.send(GEMINI_ERROR_MESSAGE)
     except Exception as e:
-        await ctx.send(f"Błąd podczas redagowania: {e}")
+        print(f"Błąd podczas redagowania: {e}")
+        await ctx.send(GEMINI_ERROR_MESSAGE)
 
 
 async def handle_edit(ctx, clean_query):
     if clean_query.isdigit():
         index = int(clean_query)
         user_id = str(ctx.author.id)
-        articles = last_articles.get(user_id, [])
+        articles = get_last_articles(user_id)
         if 1 <= index <= len(articles):
-            await edit_article(ctx, articles[index - 1])
+            await edit_article(ctx, articles[index - 1], rank=index)
         else:
             await ctx.send("Nieprawidłowy numer wiadomości do redakcji.")
     else:
-        url = f"https://newsdata.io/api/1/news?apikey={NEWSDATA_API_KEY}&q={clean_query}&language=pl"
         try:
-            response = requests.get(url)
-            data = response.json()
-            articles = data.get("results", [])[:1]
+            articles = (await fetch_articles_resilient(clean_query))[:1]
             if not articles:
                 await ctx.send("Brak wyników do redakcji.")
                 return
             await edit_article(ctx, articles[0])
+        except CircuitOpenError:
+            await ctx.send(
+                "Serwis z wiadomościami jest chwilowo niedostępny. Spróbuj ponownie za chwilę."
+            )
+        except requests.RequestException:
+            await ctx.send(NEWSDATA_ERROR_MESSAGE)
         except Exception as e:
-            await ctx.send(f"Błąd podczas redakcji: {e}")
+            print(f"Błąd podczas pobierania wiadomości do redakcji: {type(e).__name__}")
+            await ctx.send(NEWSDATA_ERROR_MESSAGE)
+
+
+async def handle_stats(ctx):
+    """Wyświetla administratorom statystyki pracy bota"""
+    permissions = getattr(ctx.author, "guild_permissions", None)
+    if not getattr(permissions, "administrator", False):
+        await ctx.send("Ta komenda jest dostępna tylko dla administratorów.")
+        return
+    await ctx.send(f"{hot_topics.summary()}\n\n{speculative_editor.summary()}")
 
 
 async def handle_favorites(ctx):
@@ -108,6 +332,69 @@ async def handle_favorites(ctx):
         await ctx.send("Nie masz jeszcze żadnych ulubionych wiadomości.")
 
 
+def build_favorites_export(user_id, export_format):
+    """Zapisuje ulubione użytkownika do skompresowanego bufora; zwraca bufor i liczbę artykułów.
+
+    Wiersze są pobierane z bazy partiami i od razu kompresowane, więc zużycie
+    pamięci nie zależy od liczby ulubionych.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    count = 0
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as compressed:
+        with io.TextIOWrapper(compressed, encoding="utf-8", newline="") as text:
+            if export_format == "csv":
+                writer = csv.DictWriter(
+                    text, fieldnames=EXPORT_FIELDS, extrasaction="ignore"
+                )
+                writer.writeheader()
+                for item in iter_favorites_db(user_id):
+                    writer.writerow(item)
+                    count += 1
+            else:
+                text.write("[")
+                for item in iter_favorites_db(user_id):
+                    if count:
+                        text.write(",")
+                    row = {field: item[field] for field in EXPORT_FIELDS}
+                    text.write(json.dumps(row, ensure_ascii=False))
+                    count += 1
+                text.write("]")
+    buffer.seek(0)
+    return buffer, count
+
+
+async def handle_export(ctx, export_format):
+    """Wysyła ulubione artykuły użytkownika jako jeden załącznik"""
+    export_format = (export_format or "json").lower()
+    if export_format not in ("json", "csv"):
+        await ctx.send("Użycie: `!news eksport [json|csv]`")
+        return
+
+    user_id = str(ctx.author.id)
+    buffer, count = await asyncio.to_thread(
+        build_favorites_export, user_id, export_format
+    )
+    try:
+        if not count:
+            await ctx.send("Nie masz jeszcze żadnych ulubionych wiadomości.")
+            return
+
+        size = buffer.seek(0, io.SEEK_END)
+        buffer.seek(0)
+        if size > EXPORT_MAX_UPLOAD_SIZE:
+            await ctx.send("Eksport jest zbyt duży, aby wysłać go jako załącznik.")
+            return
+
+        file = discord.File(buffer, filename=f"ulubione.{export_format}.gz")
+        try:
+            await ctx.send(f"📦 Eksport ulubionych ({count} artykułów):", file=file)
+        finally:
+            # Przywraca oryginalne close() bufora podmienione przez discord.File
+            file.close()
+    finally:
+        buffer.close()
+
+
 @bot.command(name="news")
 async def fetch_news(ctx, *, query: str = None):
     if not query:
@@ -116,11 +403,15 @@ async def fetch_news(ctx, *, query: str = None):
 **Pomoc - Komendy !news:**
 `!news <temat>` - Wyszukaj najnowsze wiadomości na dany temat (domyślnie 3 artykuły).
 `!news <temat> [liczba]` - Wyszukaj określoną liczbę wiadomości (1-10) na dany temat.
+`!news <temat>; <temat>; ...` - Wyszukaj wiadomości z kilku tematów naraz (wyniki posortowane od najnowszych).
+`!news <temat> jezyk:pl,en` - Wyszukaj wiadomości w wybranych językach (domyślnie pl).
 `!news redaguj <temat>` - Pobierz wiadomości i zredaguj ich treść za pomocą AI.
 `!news redaguj <numer>` - Zredaguj wiadomość z ostatnio wyświetlonych wyników.
 `!news ulubione` - Zobacz swoje zapisane ulubione wiadomości.
+`!news eksport [json|csv]` - Pobierz swoje ulubione wiadomości jako skompresowany plik.
 `!news dodaj <numer>` - Dodaj wskazaną wiadomość z listy do ulubionych.
 `!news usun <numer>` - Usuń wskazaną wiadomość z listy ulubionych.
+Wszystkie komendy są dostępne także jako `/news` (np. `/news szukaj`).
 """
         )
         return
@@ -128,6 +419,7 @@ async def fetch_news(ctx, *, query: str = None):
     command_handlers = {
         "help": handle_help,
         "ulubione": handle_favorites,
+        "statystyki": handle_stats,
     }
 
     # Sprawdzanie czy zapytanie to jedna z komend
@@ -146,6 +438,10 @@ async def fetch_news(ctx, *, query: str = None):
         await handle_edit(ctx, clean_query)
         return
 
+    if query.lower().startswith("eksport"):
+        await handle_export(ctx, query[len("eksport") :].strip())
+        return
+
     if query.lower().startswith("dodaj"):
         try:
             index = int(query[len("dodaj") :].strip())
@@ -165,21 +461,168 @@ async def fetch_news(ctx, *, query: str = None):
     await fetch_and_send_news(ctx, query)
 
 
-async def fetch_and_send_news(ctx, query):
-    """Pobiera wiadomości z API i wysyła je do kanału"""
-    parts = query.split()
-    if len(parts) > 1 and parts[-1].isdigit():
-        article_count = min(max(1, int(parts[-1])), 10)
-        search_query = " ".join(parts[:-1])
+def get_newsdata_json(params):
+    # Klucz API trafia tylko do parametrów zapytania - komunikaty o błędach zawierają
+    # pełny URL, więc nie wolno ich pokazywać użytkownikom
+    response = requests.get(
+        NEWSDATA_URL,
+        params={"apikey": NEWSDATA_API_KEY, **params},
+        timeout=NEWSDATA_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_articles(query, language=DEFAULT_LANGUAGE):
+    """Pobiera listę artykułów z NewsData dla jednego tematu i języka"""
+    params = {"q": query, "language": language}
+    # Klucz nagrania to URL bez klucza API
+    request = requests.Request("GET", NEWSDATA_URL, params=params).prepare().url
+    data = upstream_recorder.call(
+        "newsdata", request, lambda: get_newsdata_json(params)
+    )
+    return data.get("results", [])
+
+
+async def fetch_articles_resilient(query, language=DEFAULT_LANGUAGE, refresh=False):
+    """Pobiera artykuły przez warstwę odporności; przy otwartym bezpieczniku zwraca ostatnie zapisane wyniki
+
+    Wyniki młodsze niż NEWS_CACHE_TTL są zwracane bez zapytania do API, chyba że `refresh=True`.
+    """
+    key = (normalize_topic(query), language)
+    cached = news_archive.get(key)
+    if cached and not refresh and time.monotonic() - cached[0] < NEWS_CACHE_TTL:
+        return cached[1]
+
+    try:
+        articles = await newsdata_upstream.call(fetch_articles, query, language)
+    except CircuitOpenError:
+        if cached:
+            return cached[1]
+        raise
+
+    news_archive[key] = (time.monotonic(), articles)
+    news_archive.move_to_end(key)
+    if len(news_archive) > NEWS_ARCHIVE_SIZE:
+        news_archive.popitem(last=False)
+    return articles
+
+
+def parse_news_query(query):
+    """Rozbija zapytanie na listę tematów, listę języków i liczbę artykułów.
+
+    Tematy rozdzielane są średnikiem, języki podaje się jako `jezyk:pl,en`,
+    a opcjonalna liczba artykułów jest ostatnim słowem zapytania.
+    """
+    languages = []
+    words = []
+    for word in query.split():
+        if word.lower().startswith("jezyk:"):
+            languages.extend(
+                lang.strip().lower()
+                for lang in word[len("jezyk:") :].split(",")
+                if lang.strip()
+            )
+        else:
+            words.append(word)
+
+    if len(words) > 1 and words[-1].isdigit():
+        article_count = min(max(1, int(words[-1])), 10)
+        words = words[:-1]
     else:
         article_count = 3  # Domyślna liczba artykułów
-        search_query = query
 
-    url = f"https://newsdata.io/api/1/news?apikey={NEWSDATA_API_KEY}&q={search_query}&language=pl"
+    topics = []
+    for topic in " ".join(words).split(";"):
+        topic = topic.strip()
+        if topic and topic not in topics:
+            topics.append(topic)
+
+    # Usuwanie powtórzeń przy zachowaniu kolejności
+    languages = list(dict.fromkeys(languages)) or [DEFAULT_LANGUAGE]
+    return topics, languages, article_count
+
+
+def merge_articles(results):
+    """Łączy wyniki wielu zapytań, usuwa duplikaty po linku i sortuje po dacie publikacji"""
+    merged = []
+    seen_links = set()
+    for articles in results:
+        for article in articles:
+            link = article.get("link")
+            if link and link in seen_links:
+                continue
+            seen_links.add(link)
+            merged.append(article)
+
+    # Sortowanie stabilne - artykuły bez daty zachowują kolejność z API
+    merged.sort(key=lambda article: article.get("pubDate") or "", reverse=True)
+    return merged
+
+
+async def fetch_articles_concurrently(topics, languages):
+    """Wysyła zapytania dla wszystkich par temat/język równolegle z ograniczeniem współbieżności
+
+    Zwraca połączone artykuły oraz listę par (temat, język), których nie udało się pobrać.
+    """
+    semaphore = asyncio.Semaphore(NEWSDATA_MAX_CONCURRENCY)
+
+    async def fetch_one(topic, language):
+        async with semaphore:
+            return await fetch_articles_resilient(topic, language)
+
+    pairs = [(topic, language) for topic in topics for language in languages]
+    results = await asyncio.gather(
+        *(fetch_one(topic, language) for topic, language in pairs),
+        return_exceptions=True,
+    )
+
+    successful = [result for result in results if not isinstance(result, Exception)]
+    if not successful:
+        # Wszystkie zapytania zawiodły - zgłaszamy pierwszy błąd
+        raise results[0]
+    failed = [
+        pair for pair, result in zip(pairs, results) if isinstance(result, Exception)
+    ]
+    return merge_articles(successful), failed
+
+
+async def fetch_and_send_news(ctx, query):
+    """Pobiera wiadomości z API i wysyła je do kanału"""
+    topics, languages, article_count = parse_news_query(query)
+    if not topics:
+        await ctx.send("Użycie: `!news <temat>; <temat> [liczba] [jezyk:pl,en]`")
+        return
+
+    await send_news(ctx, topics, languages, article_count)
+
+
+async def send_news(ctx, topics, languages, article_count):
+    """Pobiera wiadomości dla podanych tematów i języków i wysyła je do kanału"""
+    if (
+        len(topics) > NEWSDATA_MAX_TOPICS
+        or len(languages) > NEWSDATA_MAX_LANGUAGES
+        or len(topics) * len(languages) > NEWSDATA_MAX_REQUESTS
+    ):
+        await ctx.send(
+            f"Możesz podać maksymalnie {NEWSDATA_MAX_TOPICS} tematów i "
+            f"{NEWSDATA_MAX_LANGUAGES} języki, łącznie {NEWSDATA_MAX_REQUESTS} "
+            "par temat/język. Użycie: `!news <temat>; <temat> [liczba] [jezyk:pl,en]`"
+        )
+        return
+
+    for topic in topics:
+        for language in languages:
+            hot_topics.add(topic, language)
+
     try:
-        response = requests.get(url)
-        data = response.json()
-        articles = data.get("results", [])[:article_count]
+        articles, failed = await fetch_articles_concurrently(topics, languages)
+        articles = articles[:article_count]
+        if failed:
+            failed_list = ", ".join(
+                f"{topic} [{language}]" for topic, language in failed
+            )
+            await ctx.send(f"⚠️ Nie udało się pobrać wyników dla: {failed_list}")
         if not articles:
             await ctx.send("Brak wyników dla podanego zapytania.")
             return
@@ -191,17 +634,25 @@ async def fetch_and_send_news(ctx, query):
                 f"🔖 **{title}**\n🔗 {link}\nDodaj do ulubionych: `!news dodaj {i+1}`"
             )
 
-        last_articles[str(ctx.author.id)] = articles
+        remember_articles(str(ctx.author.id), articles)
+        speculative_editor.schedule(articles)
 
+    except CircuitOpenError:
+        await ctx.send(
+            "Serwis z wiadomościami jest chwilowo niedostępny. Spróbuj ponownie za chwilę."
+        )
+    except requests.RequestException:
+        await ctx.send(NEWSDATA_ERROR_MESSAGE)
     except Exception as e:
-        await ctx.send(f"Błąd podczas pobierania danych: {e}")
+        print(f"Błąd podczas pobierania wiadomości: {type(e).__name__}")
+        await ctx.send(NEWSDATA_ERROR_MESSAGE)
 
 
 @bot.command(name="fav")
 async def add_favorite(ctx, index: int):
     """Dodaje artykuł do ulubionych w bazie danych"""
     user_id = str(ctx.author.id)
-    articles = last_articles.get(user_id, [])
+    articles = get_last_articles(user_id)
 
     if 0 < index <= len(articles):
         article = articles[index - 1]
@@ -209,7 +660,14 @@ async def add_favorite(ctx, index: int):
         link = article.get("link", "")
 
         # Zapisywanie w bazie danych
-        add_favorite_db(user_id, title, link)
+        add_favorite_db(
+            user_id,
+            title,
+            link,
+            article_id=article.get("article_id"),
+            description=article.get("description"),
+            pub_date=article.get("pubDate"),
+        )
 
         await ctx.send(f"Dodano do ulubionych: **{title}**")
     else:
@@ -242,5 +700,135 @@ async def remove_favorite(ctx, index: int):
         await ctx.send(f"Nie znaleziono artykułu numer {index} w Twoich ulubionych.")
 
 
+class InteractionContext:
+    """Udostępnia interakcję komendy /news w formie zgodnej z `ctx` komend prefiksowych.
+
+    Pierwsza wiadomość jest odpowiedzią na interakcję (chyba że została już odroczona),
+    kolejne wysyłane są jako wiadomości uzupełniające.
+    """
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.author = interaction.user
+
+    async def send(self, content=None, **kwargs):
+        if self.interaction.response.is_done():
+            await self.interaction.followup.send(content, **kwargs)
+        else:
+            await self.interaction.response.send_message(content, **kwargs)
+
+
+async def defer_interaction(interaction):
+    """Odracza odpowiedź na interakcję przed wolnymi zapytaniami do NewsData/Gemini"""
+    await interaction.response.defer(thinking=True)
+    return InteractionContext(interaction)
+
+
+news_group = app_commands.Group(
+    name="news", description="Najnowsze wiadomości z NewsData i redakcja AI"
+)
+
+
+@news_group.command(name="szukaj", description="Wyszukaj najnowsze wiadomości")
+@app_commands.describe(
+    temat="Temat lub kilka tematów rozdzielonych średnikiem",
+    liczba="Liczba artykułów (1-10)",
+    jezyk="Języki rozdzielone przecinkiem, np. pl,en",
+)
+async def slash_search(
+    interaction: discord.Interaction,
+    temat: str,
+    liczba: app_commands.Range[int, 1, 10] = 3,
+    jezyk: str = DEFAULT_LANGUAGE,
+):
+    # Usuwanie pustych wpisów i powtórzeń przy zachowaniu kolejności
+    topics = list(dict.fromkeys(t.strip() for t in temat.split(";") if t.strip()))
+    languages = list(
+        dict.fromkeys(lang.strip().lower() for lang in jezyk.split(",") if lang.strip())
+    )
+    ctx = await defer_interaction(interaction)
+    if not topics:
+        await ctx.send("Podaj temat wiadomości.")
+        return
+    await send_news(ctx, topics, languages or [DEFAULT_LANGUAGE], liczba)
+
+
+@news_group.command(name="redaguj", description="Zredaguj wiadomość za pomocą AI")
+@app_commands.describe(cel="Numer z ostatnich wyników albo temat do wyszukania")
+async def slash_edit(interaction: discord.Interaction, cel: str):
+    ctx = await defer_interaction(interaction)
+    await handle_edit(ctx, cel.strip())
+
+
+@news_group.command(name="ulubione", description="Zobacz swoje ulubione wiadomości")
+async def slash_favorites(interaction: discord.Interaction):
+    await handle_favorites(InteractionContext(interaction))
+
+
+@news_group.command(name="dodaj", description="Dodaj wiadomość z listy do ulubionych")
+@app_commands.describe(numer="Numer wiadomości z ostatnich wyników")
+async def slash_add_favorite(interaction: discord.Interaction, numer: int):
+    await add_favorite(InteractionContext(interaction), numer)
+
+
+@news_group.command(name="usun", description="Usuń wiadomość z ulubionych")
+@app_commands.describe(numer="Numer wiadomości z listy ulubionych")
+async def slash_remove_favorite(interaction: discord.Interaction, numer: int):
+    await remove_favorite(InteractionContext(interaction), numer)
+
+
+@news_group.command(name="eksport", description="Pobierz ulubione jako plik")
+@app_commands.describe(format="Format pliku")
+async def slash_export(
+    interaction: discord.Interaction, format: Literal["json", "csv"] = "json"
+):
+    ctx = await defer_interaction(interaction)
+    await handle_export(ctx, format)
+
+
+@news_group.command(name="pomoc", description="Lista komend bota")
+async def slash_help(interaction: discord.Interaction):
+    await handle_help(InteractionContext(interaction))
+
+
+@news_group.command(name="statystyki", description="Statystyki bota (administratorzy)")
+async def slash_stats(interaction: discord.Interaction):
+    await handle_stats(InteractionContext(interaction))
+
+
+bot.tree.add_command(news_group)
+
+
+@tasks.loop(seconds=HOT_TOPICS_WARM_INTERVAL)
+async def warm_hot_topics():
+    """Odświeża wyniki najpopularniejszych tematów, zanim wygasną w pamięci podręcznej"""
+    now = time.monotonic()
+    recent_topics = hot_topics.top(
+        HOT_TOPICS_WARM_K, min_count=HOT_TOPICS_WARM_MIN_COUNT, max_age=NEWS_CACHE_TTL
+    )
+    for topic, language, _ in recent_topics:
+        cached = news_archive.get((topic, language))
+        # Odświeżamy wpisy, które wygasną przed kolejnym uruchomieniem pętli
+        if cached and now - cached[0] + HOT_TOPICS_WARM_INTERVAL < NEWS_CACHE_TTL:
+            continue
+        try:
+            await fetch_articles_resilient(topic, language, refresh=True)
+        except Exception as e:
+            # Bez treści wyjątku - komunikat HTTPError zawiera URL z kluczem API
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            reason = f"HTTP {status}" if status is not None else type(e).__name__
+            print(f"Nie udało się odświeżyć tematu {topic} [{language}]: {reason}")
+
+
+async def setup_hook():
+    if SYNC_SLASH_COMMANDS:
+        await bot.tree.sync()
+    if NEWS_CACHE_TTL > 0 and HOT_TOPICS_WARM_K > 0:
+        warm_hot_topics.start()
+
+
+bot.setup_hook = setup_hook
+
+
 if __name__ == "__main__":
     bot.run(DISCORD_TOKEN)
@@ -0,0 +1,118 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+
+class ReplayMissError(KeyError):
+    """Zgłaszany w trybie odtwarzania, gdy nagranie nie zawiera danego zapytania."""
+
+
+class UpstreamRecorder:
+    """Nagrywa odpowiedzi zewnętrznych API na dysk albo odtwarza je bez dostępu do sieci.
+
+    Tryby: `off` (bez zmian), `record` (zapytania idą do API, a odpowiedzi z czasami
+    trwania trafiają do pliku JSONL kompresowanego gzipem) oraz `replay` (odpowiedzi
+    są czytane z plików, z oryginalnym opóźnieniem pomnożonym przez `latency_scale`).
+    `path` to katalog - każda sesja nagrywania zapisuje osobny plik, więc przerwany
+    proces psuje co najwyżej koniec własnego pliku. Klucze API są usuwane z nagrań.
+    Nagrywane są tylko udane odpowiedzi.
+    """
+
+    def __init__(self, mode="off", path=None, latency_scale=1.0, secrets=()):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Nieznany tryb nagrywania: {mode}")
+        self.mode = mode
+        self.path = pathlib.Path(path) if path else None
+        self.latency_scale = latency_scale
+        self.secrets = [secret for secret in secrets if secret]
+        self.lock = threading.Lock()
+        self.file = None
+        self.entries = None  # (usługa, klucz) -> lista nagranych odpowiedzi
+        self.positions = defaultdict(int)
+
+    def redact(self, text):
+        """Usuwa klucze API z tekstu zapisywanego na dysk."""
+        text = re.sub(r"(apikey=)[^&\s\"]*", r"\1REDACTED", text)
+        for secret in self.secrets:
+            text = text.replace(secret, "REDACTED")
+        return text
+
+    def request_key(self, request):
+        """Klucz nagrania: URL bez klucza API, a dłuższe treści (np. prompty) jako skrót SHA-256."""
+        request = self.redact(request)
+        if request.startswith("http"):
+            return request
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def call(self, service, request, func):
+        """Wykonuje `func()` zgodnie z trybem; `request` identyfikuje zapytanie (URL lub prompt)."""
+        if self.mode == "off":
+            return func()
+        key = self.request_key(request)
+        if self.mode == "replay":
+            return self._replay(service, key)
+
+        started = time.monotonic()
+        result = func()
+        self._record(service, key, result, time.monotonic() - started)
+        return result
+
+    def _record(self, service, key, result, elapsed):
+        line = json.dumps(
+            {"s": service, "k": key, "t": round(elapsed, 4), "r": result},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        with self.lock:
+            if self.file is None:
+                self.path.mkdir(parents=True, exist_ok=True)
+                session_file = (
+                    self.path / f"upstream-{time.time_ns()}-{os.getpid()}.jsonl.gz"
+                )
+                self.file = gzip.open(session_file, "wt", encoding="utf-8")
+                atexit.register(self.close)
+            self.file.write(self.redact(line) + "\n")
+            # Zapis jest czytelny nawet po przerwaniu procesu
+            self.file.flush()
+
+    def _load(self):
+        entries = defaultdict(list)
+        files = sorted(self.path.glob("*.jsonl.gz")) if self.path.is_dir() else []
+        for session_file in files:
+            with gzip.open(session_file, "rt", encoding="utf-8") as file:
+                try:
+                    for line in file:
+                        entry = json.loads(line)
+                        entries[(entry["s"], entry["k"])].append(entry)
+                except (EOFError, zlib.error, gzip.BadGzipFile, ValueError):
+                    # Plik przerwanej sesji: wczytujemy tylko jego poprawny początek
+                    pass
+        return entries
+
+    def _replay(self, service, key):
+        with self.lock:
+            if self.entries is None:
+                self.entries = self._load()
+            recorded = self.entries.get((service, key))
+            if not recorded:
+                raise ReplayMissError(f"Brak nagrania dla {service}: {key}")
+            # Kolejne wywołania tego samego zapytania odtwarzają kolejne nagrania
+            entry = recorded[self.positions[(service, key)] % len(recorded)]
+            self.positions[(service, key)] += 1
+
+        time.sleep(entry["t"] * self.latency_scale)
+        return entry["r"]
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,185 @@
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Osobna, mała pula wątków dla dodatkowych zapytań hedged - ogranicza liczbę
+# porzuconych zapytań, które wciąż trwają w tle
+HEDGE_WORKERS = 2
+hedge_executor = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+class CircuitOpenError(Exception):
+    """Zgłaszany, gdy obwód jest otwarty i zapytanie do usługi zostało odrzucone."""
+
+    def __init__(self, name):
+        super().__init__(f"Usługa {name} jest chwilowo niedostępna")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Prosty bezpiecznik: po serii błędów odrzuca zapytania przez określony czas.
+
+    Po upływie `reset_timeout` przepuszczane jest jedno zapytanie próbne - pozostałe
+    są odrzucane, dopóki próba nie zakończy się sukcesem lub błędem.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """Zwraca True, jeśli zapytanie może zostać wysłane do usługi."""
+        state = self.state
+        if state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return state != self.OPEN
+
+    def release_probe(self):
+        """Kończy zapytanie próbne, które nie rozstrzygnęło stanu usługi (np. przerwane)."""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        # W stanie półotwartym pojedynczy błąd ponownie otwiera obwód
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def reset(self):
+        self.record_success()
+
+
+class LatencyTracker:
+    """Przechowuje czasy ostatnich odpowiedzi i wylicza z nich percentyle."""
+
+    def __init__(self, window=100, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct=95):
+        """Zwraca percentyl czasu odpowiedzi lub None, jeśli próbek jest za mało."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+async def hedged_call(func, *args, delay):
+    """Wywołuje funkcję w wątku; jeśli nie skończy się w `delay` sekund, wysyła drugie zapytanie.
+
+    Zwracany jest wynik pierwszego zapytania zakończonego sukcesem. Wątku nie da się
+    przerwać, więc wolniejsze zapytanie jest porzucane i kończy się w tle. Drugie
+    zapytanie trafia do puli `hedge_executor` - gdy jest zajęta, czeka w kolejce
+    i zostaje anulowane bez wysyłania, jeśli pierwsze zapytanie skończy się wcześniej.
+    """
+    first = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    loop = asyncio.get_running_loop()
+    pending = {first, loop.run_in_executor(hedge_executor, func, *args)}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
+
+
+class ResilientUpstream:
+    """Opakowuje wywołania zewnętrznego API: ponawianie z jitterem, zapytania hedged i bezpiecznik.
+
+    `is_transient` decyduje, które wyjątki są chwilowe - tylko one są ponawiane
+    i liczone przez bezpiecznik. Pozostałe błędy są przekazywane od razu.
+    """
+
+    def __init__(
+        self,
+        name,
+        is_transient,
+        retries=2,
+        base_delay=0.5,
+        max_delay=8.0,
+        hedge=False,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        self.name = name
+        self.is_transient = is_transient
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+
+    def backoff_delay(self, attempt):
+        """Wykładnicze opóźnienie z pełnym jitterem dla danej próby (od 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _attempt(self, func, *args):
+        hedge_delay = self.latency.percentile(95) if self.hedge else None
+        started = time.monotonic()
+        if hedge_delay is not None:
+            result = await hedged_call(func, *args, delay=hedge_delay)
+        else:
+            result = await asyncio.to_thread(func, *args)
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    async def call(self, func, *args):
+        """Wywołuje idempotentną funkcję `func(*args)` w wątku z ochroną przed awariami usługi."""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(self.name)
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    result = await self._attempt(func, *args)
+                except Exception as e:
+                    if not self.is_transient(e):
+                        raise
+                    self.breaker.record_failure()
+                    if attempt == self.retries or not self.breaker.allow_request():
+                        raise
+                    await asyncio.sleep(self.backoff_delay(attempt))
+                else:
+                    self.breaker.record_success()
+                    return result
+        finally:
+            # Próba przerwana błędem niechwilowym lub anulowaniem nie blokuje kolejnych
+            self.breaker.release_probe()
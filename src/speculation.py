@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+class SpeculativeEditor:
+    """Wstępnie redaguje przez AI najwyżej wyświetlone artykuły, zanim użytkownik o to poprosi.
+
+    Spekulacja działa w tle tylko wtedy, gdy żadne interaktywne zapytanie do AI
+    nie jest w toku, i nigdy nie przekracza godzinowego limitu wywołań, więc
+    nie zużywa limitu potrzebnego użytkownikom. `generate` powinno wysyłać dokładnie
+    jedno zapytanie (bez ponowień), bo limit jest naliczany za każde wywołanie.
+    `top_n = 0` wyłącza spekulację.
+    """
+
+    def __init__(
+        self, generate, top_n=0, budget_per_hour=30, cache_size=200, delay=1.0
+    ):
+        self.generate = generate
+        self.top_n = top_n
+        self.budget_per_hour = budget_per_hour
+        self.cache_size = cache_size
+        self.delay = delay
+        self.cache = OrderedDict()  # link -> zredagowany tekst
+        self.in_flight = {}  # link -> Future z wynikiem trwającej redakcji
+        self.spent = deque()  # czasy wywołań spekulacyjnych z ostatniej godziny
+        self.interactive_calls = 0
+        self.tasks = set()
+        self.stats = Counter()
+        self.hits_by_rank = Counter()
+        self.misses_by_rank = Counter()
+
+    @property
+    def enabled(self):
+        return self.top_n > 0
+
+    @asynccontextmanager
+    async def interactive(self):
+        """Oznacza interaktywne wywołanie AI - w tym czasie spekulacja jest wstrzymana."""
+        self.interactive_calls += 1
+        try:
+            yield
+        finally:
+            self.interactive_calls -= 1
+
+    def take(self, link, rank=None):
+        """Zwraca gotową redakcję artykułu lub None; `rank` to pozycja artykułu na liście wyników.
+
+        Statystyki liczone są tylko dla odwołań z pozycją, czyli do artykułów,
+        które mogły zostać zredagowane wcześniej.
+        """
+        if not self.enabled:
+            return None
+        text = self.cache.get(link)
+        if text is not None:
+            self.cache.move_to_end(link)
+        if rank is None:
+            return text
+        if text is None:
+            self.stats["misses"] += 1
+            self.misses_by_rank[rank] += 1
+        else:
+            self.stats["hits"] += 1
+            self.hits_by_rank[rank] += 1
+        return text
+
+    async def take_or_wait(self, link, rank=None):
+        """Jak `take`, ale gdy redakcja artykułu właśnie trwa w tle, czeka na jej wynik.
+
+        Dzięki temu interaktywne zapytanie nie wysyła drugiego zapytania do AI
+        o ten sam artykuł. Gdy redakcja w tle się nie powiedzie, zwraca None.
+        """
+        pending = self.in_flight.get(link) if self.enabled else None
+        if pending is not None:
+            # shield: anulowanie oczekującego nie przerywa redakcji w tle
+            await asyncio.shield(pending)
+        return self.take(link, rank)
+
+    def schedule(self, articles):
+        """Uruchamia w tle wstępną redakcję pierwszych `top_n` artykułów."""
+        if not self.enabled:
+            return
+        task = asyncio.create_task(self._speculate(articles[: self.top_n]))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _budget_available(self):
+        hour_ago = time.monotonic() - 3600
+        while self.spent and self.spent[0] < hour_ago:
+            self.spent.popleft()
+        return len(self.spent) < self.budget_per_hour
+
+    def _store(self, link, text):
+        self.cache[link] = text
+        self.cache.move_to_end(link)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def _is_pending(self, link):
+        return link in self.cache or link in self.in_flight
+
+    async def _speculate(self, articles):
+        for article in articles:
+            link = article.get("link")
+            if not link or self._is_pending(link):
+                continue
+
+            # Niski priorytet: ustępujemy interaktywnym zapytaniom
+            await asyncio.sleep(self.delay)
+            # W czasie oczekiwania artykuł mógł zostać zredagowany przez inne zadanie
+            if self._is_pending(link):
+                continue
+            if self.interactive_calls:
+                self.stats["skipped_busy"] += 1
+                return
+            if not self._budget_available():
+                self.stats["skipped_budget"] += 1
+                return
+
+            self.spent.append(time.monotonic())
+            result = asyncio.get_running_loop().create_future()
+            self.in_flight[link] = result
+            try:
+                text = await self.generate(article)
+            except Exception:
+                self.stats["failed"] += 1
+                return
+            else:
+                self.stats["generated"] += 1
+                self._store(link, text)
+            finally:
+                del self.in_flight[link]
+                # Oczekujący dostają wynik z pamięci podręcznej (lub None po błędzie)
+                result.set_result(None)
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self):
+        """Krótki opis statystyk do wyświetlenia administratorowi."""
+        ranks = sorted(set(self.hits_by_rank) | set(self.misses_by_rank))
+        per_rank = ", ".join(
+            f"#{rank}: {self.hits_by_rank[rank]}/{self.hits_by_rank[rank] + self.misses_by_rank[rank]}"
+            for rank in ranks
+        )
+        return (
+            f"Spekulacyjna redakcja AI (N={self.top_n}, limit {self.budget_per_hour}/h): "
+            f"trafienia {self.stats['hits']}, chybienia {self.stats['misses']}, "
+            f"skuteczność {self.hit_rate():.0%}, wygenerowane {self.stats['generated']}, "
+            f"pominięte (zajęte AI/limit) {self.stats['skipped_busy']}/{self.stats['skipped_budget']}"
+            + (f"\nTrafienia wg pozycji: {per_rank}" if per_rank else "")
+        )
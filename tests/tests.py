@@ -1,13 +1,17 @@
+import asyncio
 import pytest
 import sqlite3
 import pathlib
 import os
+import time
 from datetime import datetime
 from src.database import (
     init_db,
     add_favorite_db,
     get_favorites_db,
     remove_favorite_db,
+    get_article_popularity_db,
+    get_popular_articles_db,
     DB_DIR,
     DB_PATH,
 )
@@ -19,6 +23,7 @@ from src.newser import (
     handle_favorites,
     remove_favorite,
     add_favorite,
+    parse_news_query,
 )
 
 
@@ -57,6 +62,30 @@ def test_db():
             pass  # Ignoruj błędy usuwania pliku
 
 
+@pytest.fixture(autouse=True)
+def isolated_db(tmp_path, monkeypatch):
+    """Fixture kierujący zapisy (np. sesji) do tymczasowej bazy zamiast data/newser.db"""
+    from src import newser
+
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "newser.db")
+    init_db()
+    newser.last_articles.clear()
+    newser.session_expiry.clear()
+    yield
+    newser.last_articles.clear()
+    newser.session_expiry.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_news_cache():
+    """Fixture czyszczący pamięć podręczną wyników NewsData między testami"""
+    from src import newser
+
+    newser.news_archive.clear()
+    yield
+    newser.news_archive.clear()
+
+
 @pytest.mark.asyncio
 async def test_database_article_operations(test_db):
     """Test operacji na artykułach w bazie danych"""
@@ -247,6 +276,50 @@ async def test_fetch_news_error_handling():
         assert "Błąd podczas pobierania danych" in ctx.send.call_args[0][0]
 
 
+@pytest.mark.asyncio
+async def test_newsdata_error_does_not_leak_api_key():
+    import requests
+    from src import newser
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    # Prawdziwa odpowiedź 422 - raise_for_status umieszcza pełny URL w komunikacie
+    error_response = requests.Response()
+    error_response.status_code = 422
+    error_response.reason = "UNPROCESSABLE ENTITY"
+    error_response.url = f"{newser.NEWSDATA_URL}?apikey=SECRETKEY&q=sport&language=xx"
+
+    with patch.object(newser, "NEWSDATA_API_KEY", "SECRETKEY"), patch(
+        "requests.get", return_value=error_response
+    ) as mock_get:
+        await fetch_news(ctx, query="sport jezyk:xx")
+        await fetch_news(ctx, query="redaguj sport")
+
+    assert mock_get.call_args.kwargs["params"]["apikey"] == "SECRETKEY"
+    assert ctx.send.call_count == 2
+    for call in ctx.send.call_args_list:
+        assert "SECRETKEY" not in call[0][0]
+        assert call[0][0] == newser.NEWSDATA_ERROR_MESSAGE
+
+
+@pytest.mark.asyncio
+async def test_gemini_error_is_not_sent_to_channel():
+    from google.api_core import exceptions as google_exceptions
+    from src import newser
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    article = {"title": "Test", "description": "Opis", "link": "https://test.pl"}
+
+    error = google_exceptions.PermissionDenied("API disabled, project projects/123")
+    with patch.object(newser.model, "generate_content", side_effect=error):
+        await newser.edit_article(ctx, article)
+
+    ctx.send.assert_called_once_with(newser.GEMINI_ERROR_MESSAGE)
+
+
 @pytest.mark.asyncio
 async def test_fetch_news_with_redaguj():
     ctx = AsyncMock()
@@ -545,3 +618,927 @@ async def test_remove_favorite_invalid_index():
         or "nie znaleziono" in ctx.send.call_args_list[0][0][0].lower()
         or "spróbuj ponownie" in ctx.send.call_args_list[0][0][0].lower()
     )
+
+
+def test_parse_news_query_multiple_topics():
+    topics, languages, count = parse_news_query("sport; polityka;tech jezyk:pl,EN 5")
+
+    assert topics == ["sport", "polityka", "tech"]
+    assert languages == ["pl", "en"]
+    assert count == 5
+
+    # Domyślne wartości dla pojedynczego tematu
+    assert parse_news_query("sztuczna inteligencja") == (
+        ["sztuczna inteligencja"],
+        ["pl"],
+        3,
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_multiple_topics_merged():
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    responses = {
+        "sport": [
+            {
+                "title": "Reprezentacja Polski awansuje na mistrzostwa",
+                "link": "https://sport.pl/awans",
+                "pubDate": "2024-05-01 10:00:00",
+            },
+            {
+                "title": "Rząd dofinansuje budowę stadionów",
+                "link": "https://wspolny.pl/stadiony",
+                "pubDate": "2024-05-03 08:00:00",
+            },
+        ],
+        "polityka": [
+            {
+                "title": "Rząd dofinansuje budowę stadionów",
+                "link": "https://wspolny.pl/stadiony",
+                "pubDate": "2024-05-03 08:00:00",
+            },
+            {
+                "title": "Sejm przyjął nową ustawę budżetową",
+                "link": "https://polityka.pl/budzet",
+                "pubDate": "2024-05-02 12:00:00",
+            },
+        ],
+    }
+
+    def fake_get(url, *args, **kwargs):
+        response = MagicMock()
+        topic = kwargs["params"]["q"]
+        response.json.return_value = {"results": responses[topic]}
+        return response
+
+    with patch("requests.get", side_effect=fake_get) as mock_get:
+        await fetch_news(ctx, query="sport; polityka 10")
+
+    # Jedno zapytanie na temat, duplikat usunięty, wyniki od najnowszych
+    assert mock_get.call_count == 2
+    assert ctx.send.call_count == 3
+    assert "stadionów" in ctx.send.call_args_list[0][0][0]
+    assert "ustawę budżetową" in ctx.send.call_args_list[1][0][0]
+    assert "awansuje" in ctx.send.call_args_list[2][0][0]
+
+
+@pytest.mark.asyncio
+async def test_resilient_upstream_retries_transient_errors():
+    from src.resilience import ResilientUpstream
+
+    upstream = ResilientUpstream(
+        "Test", lambda e: isinstance(e, ConnectionError), retries=2, base_delay=0
+    )
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("chwilowy błąd")
+        return "ok"
+
+    assert await upstream.call(flaky) == "ok"
+    assert len(calls) == 3
+    assert upstream.breaker.state == "closed"
+
+    # Błędy niechwilowe nie są ponawiane
+    def broken():
+        calls.append(1)
+        raise ValueError("zła odpowiedź")
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        await upstream.call(broken)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_after_transient_failures():
+    from src.resilience import CircuitOpenError, ResilientUpstream
+
+    upstream = ResilientUpstream(
+        "Test",
+        lambda e: isinstance(e, ConnectionError),
+        retries=0,
+        base_delay=0,
+        failure_threshold=3,
+    )
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise ConnectionError("usługa nie odpowiada")
+
+    for _ in range(3):
+        assert upstream.breaker.state == "closed"
+        with pytest.raises(ConnectionError):
+            await upstream.call(down)
+    assert upstream.breaker.state == "open"
+
+    # Otwarty bezpiecznik odrzuca zapytanie bez wywoływania usługi
+    with pytest.raises(CircuitOpenError):
+        await upstream.call(down)
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_probe():
+    from src.resilience import ResilientUpstream
+
+    upstream = ResilientUpstream(
+        "Test",
+        lambda e: isinstance(e, ConnectionError),
+        retries=0,
+        base_delay=0,
+        failure_threshold=2,
+        reset_timeout=30.0,
+    )
+    breaker = upstream.breaker
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise ConnectionError("usługa nie odpowiada")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await upstream.call(down)
+    assert breaker.state == "open"
+
+    # Po upływie reset_timeout przepuszczane jest zapytanie próbne
+    breaker.opened_at -= breaker.reset_timeout
+    assert breaker.state == "half-open"
+    with pytest.raises(ConnectionError):
+        await upstream.call(down)
+    assert len(calls) == 3
+    # Nieudana próba od razu ponownie otwiera obwód
+    assert breaker.state == "open"
+
+    breaker.opened_at -= breaker.reset_timeout
+    assert await upstream.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_sends_single_probe():
+    from src.resilience import CircuitOpenError, ResilientUpstream
+
+    upstream = ResilientUpstream(
+        "Test",
+        lambda e: isinstance(e, ConnectionError),
+        retries=0,
+        base_delay=0,
+        failure_threshold=1,
+    )
+    breaker = upstream.breaker
+    calls = []
+
+    def down():
+        calls.append(1)
+        time.sleep(0.05)
+        raise ConnectionError("usługa nie odpowiada")
+
+    with pytest.raises(ConnectionError):
+        await upstream.call(down)
+    breaker.opened_at -= breaker.reset_timeout
+    calls.clear()
+
+    # Równoległe zapytania w stanie półotwartym - do usługi trafia tylko jedno
+    results = await asyncio.gather(
+        *(upstream.call(down) for _ in range(6)), return_exceptions=True
+    )
+
+    assert len(calls) == 1
+    assert sum(isinstance(r, ConnectionError) for r in results) == 1
+    assert sum(isinstance(r, CircuitOpenError) for r in results) == 5
+    assert breaker.state == "open"
+    assert not breaker.probe_in_flight
+
+
+@pytest.mark.asyncio
+async def test_hedged_call_returns_first_success_and_abandons_loser():
+    import threading
+    from src import resilience
+
+    release = threading.Event()
+    lock = threading.Lock()
+    calls = []
+    finished = []
+
+    def request():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        if first:
+            # Pierwsze zapytanie utknęło - odpowiada dopiero po teście
+            release.wait(5)
+            finished.append("wolne")
+            return "wolne"
+        return "szybkie"
+
+    try:
+        assert await resilience.hedged_call(request, delay=0.05) == "szybkie"
+        assert len(calls) == 2
+        # Wątku nie da się przerwać - porzucone zapytanie wciąż trwa
+        assert finished == []
+    finally:
+        release.set()
+
+
+@pytest.mark.asyncio
+async def test_hedged_call_cancels_queued_hedge(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from src import resilience
+
+    # Pula zapytań hedged jest zajęta przez wcześniej porzucone zapytanie
+    busy = threading.Event()
+    executor = ThreadPoolExecutor(1)
+    executor.submit(busy.wait, 5)
+    monkeypatch.setattr(resilience, "hedge_executor", executor)
+    calls = []
+
+    def request():
+        calls.append(1)
+        time.sleep(0.1)
+        return "ok"
+
+    try:
+        assert await resilience.hedged_call(request, delay=0.01) == "ok"
+        # Anulowanie dociera do puli wątków w kolejnym kroku pętli zdarzeń
+        await asyncio.sleep(0)
+    finally:
+        busy.set()
+        executor.shutdown(wait=True)
+    # Zapytanie czekające w kolejce zostało anulowane, zanim trafiło do usługi
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_serves_archived_news():
+    import requests
+    from src import newser
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    # Wpis starszy niż NEWS_CACHE_TTL - serwowany tylko przy otwartym bezpieczniku
+    newser.news_archive[("archiwum", "pl")] = (
+        time.monotonic() - newser.NEWS_CACHE_TTL,
+        [
+            {
+                "title": "Archiwalna wiadomość o pogodzie",
+                "link": "https://pogoda.pl/archiwum",
+            }
+        ],
+    )
+    breaker = newser.newsdata_upstream.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    try:
+        with patch("requests.get", side_effect=requests.ConnectionError()) as mock_get:
+            await fetch_news(ctx, query="archiwum")
+            await fetch_news(ctx, query="brak w archiwum")
+
+        # Otwarty bezpiecznik nie wysyła zapytań do API
+        mock_get.assert_not_called()
+        assert "Archiwalna wiadomość" in ctx.send.call_args_list[0][0][0]
+        assert "chwilowo niedostępny" in ctx.send.call_args_list[1][0][0]
+    finally:
+        breaker.reset()
+        newser.news_archive.clear()
+
+
+@pytest.mark.asyncio
+async def test_shared_articles_popularity(test_db):
+    """Test wspólnego przechowywania artykułów dodanych przez wielu użytkowników"""
+    link = "https://www.bankier.pl/wiadomosc/stopy-procentowe-bez-zmian"
+    title = "RPP pozostawia stopy procentowe bez zmian"
+
+    for user_id in ["1", "2", "3"]:
+        add_favorite_db(user_id, title, link)
+    add_favorite_db("1", title, link)  # Powtórne dodanie nie tworzy duplikatu
+    add_favorite_db("1", "Inny artykuł o gospodarce", "https://www.bankier.pl/inny")
+
+    with sqlite3.connect(test_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] == 2
+
+    assert len(get_favorites_db("1")) == 2
+    assert get_article_popularity_db(link) == 3
+    assert get_popular_articles_db(1) == [
+        {"title": title, "link": link, "favorites_count": 3}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_unreferenced_article_is_removed(test_db):
+    """Test usuwania artykułu, gdy ostatni użytkownik usunie go z ulubionych"""
+    link = "https://www.money.pl/inflacja-w-pazdzierniku"
+    add_favorite_db("1", "Inflacja w październiku spadła", link)
+    add_favorite_db("2", "Inflacja w październiku spadła", link)
+
+    assert remove_favorite_db("1", get_favorites_db("1")[0]["id"])
+    assert get_article_popularity_db(link) == 1
+
+    assert remove_favorite_db("2", get_favorites_db("2")[0]["id"])
+    assert not remove_favorite_db("2", 12345)
+    with sqlite3.connect(test_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] == 0
+
+
+def _create_legacy_favorites(db_path, rows):
+    """Tworzy tabelę favorites w starym formacie (title i link w każdym wierszu)"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DROP TABLE favorites")
+        conn.execute("DROP TABLE articles")
+        conn.execute("PRAGMA user_version = 0")
+        conn.execute(
+            """
+        CREATE TABLE favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            link TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+        conn.executemany(
+            "INSERT INTO favorites (user_id, title, link) VALUES (?, ?, ?)", rows
+        )
+        conn.commit()
+
+
+@pytest.mark.asyncio
+async def test_legacy_favorites_migration(test_db):
+    """Test migracji starej tabeli favorites do schematu z tabelą articles"""
+    _create_legacy_favorites(
+        test_db,
+        [
+            ("1", "Wybory samorządowe 2024", "https://pap.pl/wybory"),
+            ("2", "Wybory samorządowe 2024", "https://pap.pl/wybory"),
+            ("2", "Prognoza pogody na weekend", "https://pogoda.pl/weekend"),
+        ],
+    )
+
+    init_db()
+
+    with sqlite3.connect(test_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] == 2
+
+    user2_favorites = get_favorites_db("2")
+    assert [f["id"] for f in user2_favorites] == [2, 3]
+    assert get_article_popularity_db("https://pap.pl/wybory") == 2
+    assert remove_favorite_db("1", get_favorites_db("1")[0]["id"]) == True
+
+
+@pytest.mark.asyncio
+async def test_migrated_article_gets_article_id(test_db):
+    """Test uzupełniania article_id artykułów przeniesionych ze starej tabeli"""
+    link = "https://pap.pl/wybory"
+    _create_legacy_favorites(test_db, [("1", "Wybory samorządowe 2024", link)])
+    init_db()
+
+    add_favorite_db("2", "Wybory samorządowe 2024", link, article_id="pap-123")
+    # Kolejny zapis rozpoznaje artykuł po article_id, mimo innego linku
+    add_favorite_db(
+        "3", "Wybory samorządowe 2024", "https://pap.pl/wybory?amp", "pap-123"
+    )
+
+    with sqlite3.connect(test_db) as conn:
+        assert conn.execute("SELECT article_id FROM articles").fetchall() == [
+            ("pap-123",)
+        ]
+    assert get_article_popularity_db(link) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_migration_is_rolled_back(test_db):
+    """Test atomowości migracji - błąd w trakcie kopiowania nie zmienia bazy"""
+    _create_legacy_favorites(
+        test_db, [("1", "Nowy budżet miasta Krakowa", "https://krakow.pl/budzet")]
+    )
+
+    with patch.object(
+        database, "_copy_legacy_favorites", side_effect=sqlite3.OperationalError
+    ):
+        with pytest.raises(sqlite3.OperationalError):
+            init_db()
+
+    with sqlite3.connect(test_db) as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(favorites)")]
+        assert "title" in columns
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    # Kolejne uruchomienie kończy migrację
+    init_db()
+    assert get_favorites_db("1")[0]["link"] == "https://krakow.pl/budzet"
+
+
+@pytest.mark.asyncio
+async def test_stranded_legacy_table_is_migrated(test_db):
+    """Test dokończenia migracji przerwanej przez starszą wersję bota"""
+    with sqlite3.connect(test_db) as conn:
+        conn.execute(
+            """
+        CREATE TABLE favorites_legacy (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            link TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+        conn.execute(
+            "INSERT INTO favorites_legacy (user_id, title, link) VALUES (?, ?, ?)",
+            ("2", "Otwarcie sezonu żeglarskiego", "https://mazury.pl/zeglarstwo"),
+        )
+        conn.commit()
+
+    init_db()
+
+    assert get_favorites_db("2")[0]["title"] == "Otwarcie sezonu żeglarskiego"
+    with sqlite3.connect(test_db) as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master")]
+        assert "favorites_legacy" not in tables
+
+
+@pytest.mark.asyncio
+async def test_export_favorites_csv(test_db):
+    import csv
+    import gzip
+    import io
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 321
+    user_id = str(ctx.author.id)
+
+    for i in range(3):
+        add_favorite_db(
+            user_id,
+            f"Relacja z konferencji technologicznej, dzień {i + 1}",
+            f"https://www.spidersweb.pl/konferencja-dzien-{i + 1}",
+        )
+
+    sent_files = []
+
+    async def capture_send(*args, **kwargs):
+        # Zawartość odczytujemy przed zamknięciem bufora przez handler
+        sent_files.append((kwargs["file"].filename, kwargs["file"].fp.read()))
+
+    ctx.send.side_effect = capture_send
+    await fetch_news(ctx, query="eksport csv")
+
+    assert len(sent_files) == 1
+    filename, content = sent_files[0]
+    assert filename == "ulubione.csv.gz"
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(content).decode("utf-8"))))
+    assert len(rows) == 3
+    assert {row["link"] for row in rows} == {
+        f"https://www.spidersweb.pl/konferencja-dzien-{i + 1}" for i in range(3)
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_favorites_invalid_format(test_db):
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 321
+
+    await fetch_news(ctx, query="eksport xml")
+
+    ctx.send.assert_called_once_with("Użycie: `!news eksport [json|csv]`")
+
+
+@pytest.mark.asyncio
+async def test_last_articles_survive_restart(test_db):
+    from src import newser
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 555
+    user_id = str(ctx.author.id)
+
+    newser.remember_articles(
+        user_id,
+        [
+            {
+                "title": "Otwarcie nowej linii metra w Warszawie",
+                "link": "https://www.um.warszawa.pl/metro-otwarcie",
+                "content": "Pełna treść nie jest zapisywana w sesji.",
+            }
+        ],
+    )
+
+    # Symulacja restartu - pamięć podręczna jest pusta
+    newser.last_articles.pop(user_id)
+
+    await add_favorite(ctx, 1)
+
+    ctx.send.assert_called_once()
+    assert "Otwarcie nowej linii metra" in ctx.send.call_args[0][0]
+    assert "content" not in newser.last_articles[user_id][0]
+
+
+@pytest.mark.asyncio
+async def test_expired_session_is_not_loaded(test_db):
+    from src.database import load_session_db, save_session_db
+
+    save_session_db(
+        "666", [{"title": "Stara wiadomość", "link": "https://old.pl"}], ttl=-1
+    )
+    assert load_session_db("666") is None
+
+    save_session_db("666", [{"title": "Nowa wiadomość", "link": "https://new.pl"}], 60)
+    articles, expires_at = load_session_db("666")
+    assert articles == [{"title": "Nowa wiadomość", "link": "https://new.pl"}]
+    assert expires_at > time.time()
+
+
+@pytest.mark.asyncio
+async def test_expired_in_memory_session_is_dropped(test_db, monkeypatch):
+    from src import newser
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 777
+    user_id = str(ctx.author.id)
+
+    newser.remember_articles(
+        user_id, [{"title": "Stara wiadomość", "link": "https://old.pl"}]
+    )
+    # Mija czas życia sesji, a kopia w pamięci wciąż istnieje
+    expired = time.time() + newser.SESSION_TTL + 1
+    monkeypatch.setattr(time, "time", lambda: expired)
+
+    await add_favorite(ctx, 1)
+
+    ctx.send.assert_called_once_with("Nieprawidłowy numer wiadomości.")
+    assert user_id not in newser.last_articles
+
+
+@pytest.mark.asyncio
+async def test_slash_search_defers_and_sends_followups():
+    from src.newser import news_group
+
+    interaction = MagicMock()
+    interaction.user.id = 777
+    interaction.response.defer = AsyncMock()
+    interaction.response.is_done = MagicMock(return_value=True)
+    interaction.followup.send = AsyncMock()
+
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "results": [
+            {
+                "title": "Polska reprezentacja siatkarzy wygrywa Ligę Narodów",
+                "link": "https://www.polsatsport.pl/siatkowka-liga-narodow",
+            }
+        ]
+    }
+
+    with patch("requests.get", return_value=mock_response) as mock_get:
+        await news_group.get_command("szukaj").callback(
+            interaction, temat="siatkówka", liczba=1, jezyk="pl,en"
+        )
+
+    interaction.response.defer.assert_called_once_with(thinking=True)
+    assert mock_get.call_count == 2  # Po jednym zapytaniu na język
+    interaction.followup.send.assert_called_once()
+    assert "Ligę Narodów" in interaction.followup.send.call_args[0][0]
+
+
+@pytest.mark.asyncio
+async def test_speculative_edit_served_from_cache():
+    from src import newser
+    from src.speculation import SpeculativeEditor
+
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 888
+    article = {
+        "title": "Nowa ustawa o odnawialnych źródłach energii przyjęta",
+        "description": "Sejm przyjął ustawę ułatwiającą budowę farm wiatrowych.",
+        "link": "https://www.gramwzielone.pl/ustawa-oze",
+    }
+    newser.last_articles[str(ctx.author.id)] = [article]
+
+    generate = AsyncMock(return_value="Sejm uchwalił przepisy wspierające OZE.")
+    editor = SpeculativeEditor(generate, top_n=2, delay=0)
+
+    with patch.object(newser, "speculative_editor", editor), patch(
+        "google.generativeai.GenerativeModel.generate_content"
+    ) as mock_generate:
+        editor.schedule([article])
+        await asyncio.gather(*editor.tasks)
+        await handle_edit(ctx, "1")
+
+    # Odpowiedź pochodzi z pamięci podręcznej, bez interaktywnego wywołania Gemini
+    mock_generate.assert_not_called()
+    assert "wspierające OZE" in ctx.send.call_args[0][0]
+    assert editor.stats["hits"] == 1
+    assert editor.hits_by_rank[1] == 1
+
+
+@pytest.mark.asyncio
+async def test_speculative_edit_respects_budget_and_busy_ai():
+    from src.speculation import SpeculativeEditor
+
+    articles = [
+        {"title": f"Artykuł {i}", "link": f"https://news.pl/{i}"} for i in range(3)
+    ]
+    generate = AsyncMock(return_value="Zredagowany tekst")
+
+    editor = SpeculativeEditor(generate, top_n=3, budget_per_hour=1, delay=0)
+    editor.schedule(articles)
+    await asyncio.gather(*editor.tasks)
+    assert generate.call_count == 1
+    assert editor.stats["skipped_budget"] == 1
+
+    # Podczas interaktywnego wywołania AI spekulacja nie startuje
+    busy_editor = SpeculativeEditor(generate, top_n=3, delay=0)
+    async with busy_editor.interactive():
+        busy_editor.schedule(articles)
+        await asyncio.gather(*busy_editor.tasks)
+    assert generate.call_count == 1
+    assert busy_editor.stats["skipped_busy"] == 1
+
+
+def test_hot_topics_top_k():
+    from src.hot_topics import HotTopics
+
+    hot = HotTopics(k=2)
+    for query, times in [("Sport", 5), ("polityka ", 3), ("pogoda", 1)]:
+        for _ in range(times):
+            hot.add(query, "pl")
+    hot.add("  SPORT!", "pl")
+
+    assert hot.top() == [("sport", "pl", 6), ("polityka", "pl", 3)]
+
+
+@pytest.mark.asyncio
+async def test_warm_hot_topics_refreshes_expiring_entries():
+    from src import newser
+    from src.hot_topics import HotTopics
+
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "results": [
+            {
+                "title": "Ekstraklasa: podsumowanie kolejki",
+                "link": "https://www.sport.pl/ekstraklasa-kolejka",
+            }
+        ]
+    }
+    hot = HotTopics(k=5)
+    for _ in range(3):
+        hot.add("sport", "pl")
+        hot.add("tech", "pl")
+        hot.add("nauka", "pl")
+    hot.add("pogoda", "pl")  # Zbyt rzadki temat nie jest odświeżany
+    # Świeży wpis dla "tech" nie wymaga odświeżenia
+    newser.news_archive[("tech", "pl")] = (time.monotonic(), [])
+    # "nauka" nie była wyszukiwana od dłuższego czasu
+    hot.last_seen["nauka|pl"] -= newser.NEWS_CACHE_TTL + 1
+
+    with patch.object(newser, "hot_topics", hot), patch.object(
+        newser, "HOT_TOPICS_WARM_K", 5
+    ), patch.object(newser, "HOT_TOPICS_WARM_MIN_COUNT", 3), patch(
+        "requests.get", return_value=mock_response
+    ) as mock_get:
+        await newser.warm_hot_topics.coro()
+
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs["params"]["q"] == "sport"
+    assert newser.news_archive[("sport", "pl")][1][0]["title"].startswith("Ekstraklasa")
+
+
+@pytest.mark.asyncio
+async def test_warm_hot_topics_does_not_log_api_key(capsys):
+    import requests
+    from src import newser
+    from src.hot_topics import HotTopics
+
+    error_response = requests.Response()
+    error_response.status_code = 422
+    error_response.url = f"{newser.NEWSDATA_URL}?apikey=SECRETKEY&q=sport"
+    hot = HotTopics(k=5)
+    for _ in range(3):
+        hot.add("sport", "pl")
+
+    with patch.object(newser, "hot_topics", hot), patch.object(
+        newser, "HOT_TOPICS_WARM_K", 5
+    ), patch.object(newser, "NEWSDATA_API_KEY", "SECRETKEY"), patch(
+        "requests.get", return_value=error_response
+    ):
+        await newser.warm_hot_topics.coro()
+
+    output = capsys.readouterr().out
+    assert "SECRETKEY" not in output
+    assert "sport [pl]: HTTP 422" in output
+
+
+def test_upstream_record_and_replay(tmp_path):
+    import gzip
+    from src import newser
+    from src.recorder import ReplayMissError, UpstreamRecorder
+
+    recordings = tmp_path / "nagrania"
+    mock_response = MagicMock()
+    mock_response.json.return_value = {
+        "results": [
+            {
+                "title": "Nowy rekord Polski w biegu na 400 metrów",
+                "link": "https://www.sport.pl/lekkoatletyka/rekord-400m",
+            }
+        ]
+    }
+
+    recorder = UpstreamRecorder("record", recordings, secrets=["tajny-klucz"])
+    with patch.object(newser, "upstream_recorder", recorder), patch.object(
+        newser, "NEWSDATA_API_KEY", "tajny-klucz"
+    ), patch("requests.get", return_value=mock_response):
+        recorded = newser.fetch_articles("lekkoatletyka")
+    recorder.close()
+
+    # Klucz API nie trafia do nagrania
+    (session_file,) = recordings.glob("*.jsonl.gz")
+    content = gzip.decompress(session_file.read_bytes()).decode("utf-8")
+    assert "tajny-klucz" not in content
+    assert "q=lekkoatletyka" in content
+
+    replayer = UpstreamRecorder("replay", recordings, latency_scale=0)
+    with patch.object(newser, "upstream_recorder", replayer), patch.object(
+        newser, "NEWSDATA_API_KEY", "inny-klucz"
+    ), patch("requests.get", side_effect=Exception("Brak sieci")):
+        assert newser.fetch_articles("lekkoatletyka") == recorded
+        with pytest.raises(ReplayMissError):
+            newser.fetch_articles("pływanie")
+
+
+def test_replay_survives_killed_and_corrupt_sessions(tmp_path):
+    from src.recorder import UpstreamRecorder
+
+    # Sesja przerwana bez zamknięcia pliku (np. docker stop) - brak końcówki gzip
+    killed = UpstreamRecorder("record", tmp_path)
+    killed.call("gemini", "prompt przed awarią", lambda: "tekst z przerwanej sesji")
+    # Porzucamy plik bez close(), jak po SIGTERM; referencja chroni przed
+    # zamknięciem pliku przez odśmiecanie
+    abandoned_file, killed.file = killed.file, None
+
+    # Uszkodzony plik nie może zablokować odczytu pozostałych nagrań
+    (tmp_path / "upstream-0-0.jsonl.gz").write_bytes(b"\x1f\x8b\x08\x00uszkodzone")
+
+    later = UpstreamRecorder("record", tmp_path)
+    later.call("gemini", "prompt po restarcie", lambda: "tekst z kolejnej sesji")
+    later.close()
+
+    replayer = UpstreamRecorder("replay", tmp_path, latency_scale=0)
+    before = replayer.call("gemini", "prompt przed awarią", lambda: 1 / 0)
+    after = replayer.call("gemini", "prompt po restarcie", lambda: 1 / 0)
+    assert before == "tekst z przerwanej sesji"
+    assert after == "tekst z kolejnej sesji"
+    assert not abandoned_file.closed
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_rejects_too_large_fan_out():
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    topics = "; ".join(f"temat{i}" for i in range(20))
+    with patch("requests.get") as mock_get:
+        await fetch_news(ctx, query=f"{topics} jezyk:pl,en,de,fr,es")
+        # 3 tematy x 3 języki przekracza limit par temat/język
+        await fetch_news(ctx, query="a; b; c jezyk:pl,en,de")
+
+    mock_get.assert_not_called()
+    assert ctx.send.call_count == 2
+    assert all("maksymalnie" in call[0][0] for call in ctx.send.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_reports_partial_failures():
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    def fake_get(url, *args, **kwargs):
+        if kwargs["params"]["q"] == "tech":
+            raise ValueError("Niepoprawna odpowiedź")
+        response = MagicMock()
+        response.json.return_value = {
+            "results": [
+                {
+                    "title": "Legia Warszawa awansuje do fazy grupowej",
+                    "link": "https://www.sport.pl/legia-awans",
+                }
+            ]
+        }
+        return response
+
+    with patch("requests.get", side_effect=fake_get):
+        await fetch_news(ctx, query="sport; tech")
+
+    messages = [call[0][0] for call in ctx.send.call_args_list]
+    assert any("Nie udało się pobrać wyników dla: tech [pl]" in m for m in messages)
+    assert any("Legia Warszawa" in m for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_passes_special_characters_as_params():
+    ctx = AsyncMock()
+    ctx.send = AsyncMock()
+    ctx.author.id = 123
+
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"results": []}
+
+    with patch("requests.get", return_value=mock_response) as mock_get:
+        await fetch_news(ctx, query="H&M #moda jezyk:pl&country=us")
+
+    params = mock_get.call_args.kwargs["params"]
+    assert params["q"] == "H&M #moda"
+    assert params["language"] == "pl&country=us"
+    assert "country" not in params
+
+
+@pytest.mark.asyncio
+async def test_speculative_edit_deduplicates_overlapping_schedules():
+    from src.speculation import SpeculativeEditor
+
+    articles = [
+        {"title": "Nowe połączenie kolejowe Gdańsk-Kraków", "link": "https://pkp.pl/1"}
+    ]
+    generate = AsyncMock(return_value="Zredagowany tekst")
+    editor = SpeculativeEditor(generate, top_n=1, delay=0)
+
+    editor.schedule(articles)
+    editor.schedule(articles)
+    await asyncio.gather(*editor.tasks)
+
+    assert generate.call_count == 1
+
+    # Odwołania bez pozycji (redaguj <temat>) nie wpływają na statystyki
+    assert editor.take("https://pkp.pl/1") == "Zredagowany tekst"
+    assert editor.take("https://pkp.pl/inny") is None
+    assert editor.stats["hits"] == editor.stats["misses"] == 0
+
+
+@pytest.mark.asyncio
+async def test_interactive_edit_waits_for_speculation_in_flight():
+    from src.speculation import SpeculativeEditor
+
+    link = "https://pkp.pl/1"
+    release = asyncio.Event()
+
+    async def generate(article):
+        await release.wait()
+        return "Zredagowany tekst"
+
+    generate = AsyncMock(side_effect=generate)
+    editor = SpeculativeEditor(generate, top_n=1, delay=0)
+    editor.schedule([{"title": "Nowe połączenie kolejowe", "link": link}])
+    while link not in editor.in_flight:
+        await asyncio.sleep(0)
+
+    # Użytkownik prosi o redakcję, zanim redakcja w tle się skończyła
+    waiting = asyncio.create_task(editor.take_or_wait(link, rank=1))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiting == "Zredagowany tekst"
+    assert generate.call_count == 1
+    assert editor.stats["hits"] == 1
+    assert editor.stats["misses"] == 0
+
+
+@pytest.mark.asyncio
+async def test_speculative_edit_does_not_retry_or_trip_interactive_breaker():
+    from google.api_core import exceptions as google_exceptions
+    from src import newser
+
+    article = {"title": "Prognoza pogody", "link": "https://pogoda.pl/prognoza"}
+    try:
+        with patch(
+            "google.generativeai.GenerativeModel.generate_content",
+            side_effect=google_exceptions.ServiceUnavailable("Przeciążenie"),
+        ) as mock_generate:
+            with pytest.raises(google_exceptions.ServiceUnavailable):
+                await newser.generate_speculative_edit(article)
+
+        # Jedno zapytanie na jednostkę limitu, bez ponowień
+        mock_generate.assert_called_once()
+        assert newser.speculative_gemini_upstream.breaker.failures == 1
+        assert newser.gemini_upstream.breaker.failures == 0
+    finally:
+        newser.speculative_gemini_upstream.breaker.reset()